@@ -426,7 +426,7 @@ def est_scan_time(acq):
                 total_time *= len(acq["temperatures"])
             return total_time
         elif acq["type"] == "nexafs":
-            params, time = get_nexafs_scan_params(quiet=True, **acq)
+            params, time = get_nexafs_scan_params(quiet=True, estimate_only=True, **acq)
             if acq.get("cycles", 0) > 0:
                 time *= 2 * acq.get("cycles", 0)
             total_time = time * len(acq.get("polarizations", [0]))  # time is the estimate for a single energy scan
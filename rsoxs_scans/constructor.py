@@ -4,26 +4,57 @@
 
 # imports
 import datetime
+import functools
 import numpy as np
+from collections import namedtuple
 import redis_json_dict
-import matplotlib.pyplot as plt
 from copy import deepcopy
 import warnings
 from .defaults import (
     default_speed,
     default_frames,
-    edge_names,
+    lookup_edge,
     rsoxs_edges,
     rsoxs_ratios_table,
     frames_table,
     nexafs_ratios_table,
     nexafs_edges,
     nexafs_speed_table,
-    default_warning_step_time,
 )
 
 
-def get_nexafs_scan_params(edge, speed=default_speed, ratios=None, quiet=False, **kwargs):
+def _hashable(value):
+    """Converts list-like inputs to tuples so they can be used as cache keys"""
+    if isinstance(value, (list, np.ndarray, redis_json_dict.redis_json_dict.ObservableSequence)):
+        return tuple(value)
+    return value
+
+
+def _cached_call(cached_function, *args):
+    """Calls an lru_cache'd function, or its uncached body if the arguments can't be used as a cache key
+
+    Inputs that can't be hashed, like a dict given as the edge, are invalid anyway, and the body reports them with
+    its own error instead of lru_cache's "unhashable type"
+    """
+    try:
+        hash(args)
+    except TypeError:
+        return cached_function.__wrapped__(*args)
+    return cached_function(*args)
+
+
+def clear_caches():
+    """Forgets the cached energies, NEXAFS scan parameters and exposure time specs
+
+    Results are cached by their arguments only. Call this after editing the tables in defaults (edges, ratios,
+    frames and speeds) at runtime, or results computed from the old tables keep being returned.
+    """
+    _energies.cache_clear()
+    _nexafs_scan_params.cache_clear()
+    _compile_exposure_spec.cache_clear()
+
+
+def get_nexafs_scan_params(edge, speed=default_speed, ratios=None, quiet=True, estimate_only=False, **kwargs):
     """Creates fly NEXAFS scan parameters and time estimate, given an edge (which includes thresholds for different speed regions) base speed (eV/sec) and speed ratios between the different regions
 
     Parameters
@@ -49,35 +80,53 @@ def get_nexafs_scan_params(edge, speed=default_speed, ratios=None, quiet=False,
             the values are the ratio of energy steps between the different regions defined by edge
         
     quiet : bool, optional
-        Whether to output progress report, by default False
+        Whether to suppress the progress report, by default True
+
+    estimate_only : bool, optional
+        Only estimate the time, skipping the construction of scan_params, by default False
 
     Returns
     -------
     scan_params
-        _description_ #TODO docs
+        list of (start energy, end energy, speed) tuples, one per energy region, or None if estimate_only
     time
-        _description_ #TODO docs
+        estimated duration of the scan in seconds
     """
 
+    edge, speeds, time = _cached_call(_nexafs_scan_params, _hashable(edge), _hashable(speed), _hashable(ratios))
+    if estimate_only:
+        return None, time
+    scan_params = list(zip(edge[:-1], edge[1:], speeds))
+
+    if not quiet:
+        # ------- remove this for production, it's just for looking at the output conveniently during development
+        print(scan_params)
+        print(len(scan_params))
+        print(f"time : {datetime.timedelta(seconds=time)}")
+        # --------
+
+    return scan_params, time
+
+
+@functools.lru_cache(maxsize=256)
+def _nexafs_scan_params(edge, speed, ratios):
+    """Cached core of get_nexafs_scan_params, returns the edge thresholds, region speeds and time"""
     edge_input = edge
     singleinput = False
     if isinstance(edge, str):
-        if edge.lower() in edge_names.keys():
-            edge = edge_names[edge.lower()]
-            edge_input = edge.lower()
-        if edge.lower() in nexafs_edges.keys():
-            edge = nexafs_edges[edge.lower()]
+        edge_low = edge.lower()
+        # edge_input is the lowercase edge name
+        edge_input, edge = lookup_edge(edge, nexafs_edges) or (edge_low, edge)
     if not isinstance(edge, (tuple, list, redis_json_dict.redis_json_dict.ObservableSequence)):
         raise TypeError(f"invalid edge {edge} - no key of that name was found")
     if isinstance(speed, str):
-        if speed.lower() in nexafs_speed_table.keys():
-            speed = nexafs_speed_table[speed.lower()]
+        speed = nexafs_speed_table.get(speed.lower(), speed)
     if not isinstance(speed, (float, int)):
         raise TypeError(f"NEXAFS scan speed {speed} was not found or is not a valid number")
     if ratios == None or ratios == "":
-        if str(edge_input).lower() in nexafs_ratios_table.keys():
-            ratios = nexafs_ratios_table[edge_input.lower()]
-        elif f"default {len(edge)}" in nexafs_ratios_table.keys():
+        if str(edge_input) in nexafs_ratios_table:
+            ratios = nexafs_ratios_table[str(edge_input)]
+        elif f"default {len(edge)}" in nexafs_ratios_table:
             ratios = nexafs_ratios_table[f"default {len(edge)}"]
         else:
             ratios = (1,) * (len(edge) - 1)
@@ -88,24 +137,18 @@ def get_nexafs_scan_params(edge, speed=default_speed, ratios=None, quiet=False,
         raise TypeError(f"invalid ratios {ratios}")
     if len(ratios) + 1 != len(edge):
         raise ValueError(f"got the wrong number of intervals {len(ratios)} expected {len(edge)-1}")
-    steps = 0
-    scan_params = []
-    time = 0
-    for i, ratio in enumerate(ratios):
-        scan_params += [(edge[i], edge[i + 1], float(ratio) * float(speed))]
-        time += abs(edge[i + 1] - edge[i]) / (float(ratio) * float(speed))
-
-    if not quiet:
-        # ------- remove this for production, it's just for looking at the output conveniently during development
-        print(scan_params)
-        print(len(scan_params))
-        print(f"time : {datetime.timedelta(seconds=time)}")
-        # --------
-
-    return scan_params, time
+    edge_arr = np.asarray(edge, dtype=np.float64)
+    ratios_arr = np.asarray(ratios, dtype=np.float64)
+    if edge_arr.ndim != 1:  # nested thresholds would otherwise broadcast into bogus regions
+        raise TypeError(f"invalid edge {edge} - thresholds must be numbers")
+    if ratios_arr.ndim != 1:
+        raise TypeError(f"invalid ratios {ratios}")
+    speeds = ratios_arr * float(speed)
+    time = float((np.abs(np.diff(edge_arr)) / speeds).sum())
+    return tuple(edge), tuple(speeds.tolist()), time
 
 # TODO docs
-def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs):
+def get_energies(edge, frames=default_frames, ratios=None, quiet=True, **kwargs):
     """
     creates a usable list of energies, given an edge an estimated number of frames (energies) and intervals
     Args:
@@ -123,6 +166,11 @@ def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs
             if string, this should be in the lookup table of standard intervals
             if a tuple, this must have one less element than the edge tuple (either explicitely entered or from the lookup table)
                 the values should not be thought of as energy steps, but the ratio of energy steps between the different regions defined by edge
+        quiet: bool
+            if False, print a summary of the energies and plot them (matplotlib is only imported in this case)
+    Returns:
+        a read-only array of energies, shared with other calls using the same inputs
+            use get_energies_writable if the array needs to be modified
 
     benefits of this algorithm are:
     1.) the number of frames is always known, at least approximately - this is the main cause of confusion with the existing system
@@ -142,14 +190,31 @@ def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs
     2.) direct time estimation output - added to function for exposure times below
     """
 
+    if isinstance(frames, float):
+        if np.isnan(frames):
+            frames = "full"
+    energies = _cached_call(_energies, _hashable(edge), _hashable(frames), _hashable(ratios))
+
+    if not quiet:
+        # ------- remove this for production, it's just for looking at the output conveniently during development
+        import matplotlib.pyplot as plt
+
+        print(f"{len(energies)} points, range [{energies[0]}, {energies[-1]}]")
+        plt.plot(energies, marker="x", markersize=5, linewidth=0.1)
+        plt.show()
+        # --------
+    return energies
+
+
+@functools.lru_cache(maxsize=256)
+def _energies(edge, frames, ratios):
+    """Cached core of get_energies, takes only hashable inputs"""
     edge_input = edge
     singleinput = False
     if isinstance(edge, str):
-        if edge.lower() in edge_names.keys():
-            edge = edge_names[edge.lower()]
-            edge_input = edge.lower()
-        if edge.lower() in rsoxs_edges.keys():
-            edge = rsoxs_edges[edge.lower()]
+        edge_low = edge.lower()
+        # edge_input is the lowercase edge name
+        edge_input, edge = lookup_edge(edge, rsoxs_edges) or (edge_low, edge)
         # add json read edge as option here
     if isinstance(edge_input, (float, int)):
         edge = (edge_input, edge_input)
@@ -161,12 +226,8 @@ def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs
     if len(edge)==1:
         edge *=2
         singleinput = True
-    if isinstance(frames, float):
-        if np.isnan(frames):
-            frames = "full"
     if isinstance(frames, str):
-        if frames.lower() in frames_table.keys():
-            frames = frames_table[frames.lower()]
+        frames = frames_table.get(frames.lower(), frames)
     if isinstance(frames, (list, tuple, redis_json_dict.redis_json_dict.ObservableSequence)):
         if singleinput:
             raise TypeError(f"when only a single edge threshold is given there is no valid list option for frames")
@@ -175,22 +236,24 @@ def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs
                 raise TypeError(f"if a list of frames is given all must be numbers {frame} is not a valid number")
             if frame < 0 or frame > 1000:
                 raise ValueError(f"frame numbers should be between 0 and 1000 {frame} is not a valid number")
-    if not isinstance(frames, (int, float, list, redis_json_dict.redis_json_dict.ObservableSequence)):
+            if frame != int(frame):
+                raise ValueError(f"frame numbers should be whole numbers {frame} is not a valid number")
+    if not isinstance(frames, (int, float, list, tuple, redis_json_dict.redis_json_dict.ObservableSequence)):
         raise TypeError(f"frame number {frames} was not found or is not a valid number")
     read_frames = False
     if ratios == None or ratios == "":
         if isinstance(frames, (list, tuple, redis_json_dict.redis_json_dict.ObservableSequence)):
             ratios = None
             read_frames = True
-        elif str(edge_input).lower() in rsoxs_ratios_table.keys():
-            ratios = rsoxs_ratios_table[edge_input.lower()]
-        elif f"default {len(edge)}" in rsoxs_ratios_table.keys():
+        elif str(edge_input) in rsoxs_ratios_table:
+            ratios = rsoxs_ratios_table[str(edge_input)]
+        elif f"default {len(edge)}" in rsoxs_ratios_table:
             ratios = rsoxs_ratios_table[f"default {len(edge)}"]
         else:
             ratios = (1,) * (len(edge) - 1)
     else:
         if isinstance(frames, (list, tuple, redis_json_dict.redis_json_dict.ObservableSequence)):
-            ValueError(f"frames and ratios cannot both be specified")
+            raise ValueError("frames and ratios cannot both be specified")
         if not isinstance(ratios, (tuple, int, float, list, redis_json_dict.redis_json_dict.ObservableSequence)):
             ratios = rsoxs_ratios_table[ratios]
     if not isinstance(ratios, (tuple, list, redis_json_dict.redis_json_dict.ObservableSequence)) and not read_frames:
@@ -201,47 +264,118 @@ def get_energies(edge, frames=default_frames, ratios=None, quiet=False, **kwargs
             raise ValueError(f"got the wrong number of frames. got {len(frames)}. expected {len(edge)-1}")
     if len(ratios) + 1 != len(edge):
         raise ValueError(f"got the wrong number of intervals. got {len(ratios)}. expected {len(edge)-1}")
-    energies = np.zeros(0)
+    edge_arr = np.asarray(edge, dtype=np.float64)
+    if edge_arr.ndim != 1:  # nested thresholds would otherwise broadcast into bogus intervals
+        raise TypeError(f"invalid edge {edge} - thresholds must be numbers")
     if not read_frames:
-        steps = 0
+        ratios_arr = np.asarray(ratios, dtype=np.float64)
+        if ratios_arr.ndim != 1:
+            raise TypeError(f"invalid ratios {ratios}")
         multiple = 1
-        numpnts = np.zeros_like(ratios)
-        for i, interval in enumerate(ratios):
-            numpnts[i] = np.round(np.abs(edge[i + 1] - edge[i]) / (interval * multiple))
-        steps = sum(numpnts)
+        numpnts = np.round(np.abs(np.diff(edge_arr)) / (ratios_arr * multiple))
+        steps = numpnts.sum()
         multiple *= (
             steps / frames
         )  # if there are too many steps, multiple will reduce to approximately match the frames needed
-        steps = 0
-        for i, interval in enumerate(ratios):
-            if interval < 0.01:
-                raise ValueError(f"ratio value of {interval} invalid")
-            numpnt = max(
-                1, int(np.round(np.abs(edge[i + 1] - edge[i]) / max(0.01, interval * multiple)))
-            )  # get the number of points using this multiple
-            at_end = (
-                i == len(ratios) - 1 and not singleinput
-            )  # if we are at the end, add the last point (built into linspace)
-            energies = np.append(
-                energies, np.around(np.linspace(edge[i], edge[i + 1], numpnt + at_end, endpoint=at_end) * 2, 1) / 2
-            )  # rounds to nearest 0.05 eV for clarity
+        invalid = ratios_arr < 0.01
+        if invalid.any():
+            raise ValueError(f"ratio value of {ratios[int(np.argmax(invalid))]} invalid")
+        numpnts = np.fmax(
+            1, np.round(np.abs(np.diff(edge_arr)) / np.fmax(0.01, ratios_arr * multiple))
+        ).astype(np.intp)  # get the number of points using this multiple
+        at_end = not singleinput  # add the last point of the last interval (built into linspace)
     else:
-        for i, frame in enumerate(frames):
-            numpnt = frame  # add in the endpoints
-            at_end = i == len(frames) - 1  # if we are at the end, add the last point (built into linspace)
-            energies = np.append(
-                energies, np.around(np.linspace(edge[i], edge[i + 1], numpnt + at_end, endpoint=at_end) * 2, 1) / 2
-            )  # rounds to nearest 0.05 eV for clarity
+        numpnts = np.asarray(frames, dtype=np.intp)
+        at_end = True
+    energies = _interval_energies(edge_arr, numpnts, at_end)
+    # rounds to nearest 0.05 eV for clarity, in place
+    energies *= 2
+    np.around(energies, 1, out=energies)
+    energies /= 2
+    energies.setflags(write=False)  # the cached array is shared between callers
+    return energies
 
-    if not quiet:
-        # ------- remove this for production, it's just for looking at the output conveniently during development
-        print(energies)
-        print(len(energies))
-        plt.plot(energies, marker="x", markersize=5, linewidth=0.1)
-        plt.show()
-        # --------
+
+def get_energies_writable(*args, **kwargs):
+    """Same as get_energies, but returns a private copy of the energies that can be modified"""
+    return get_energies(*args, **kwargs).copy()
+
+
+def _interval_energies(edge, numpnts, at_end):
+    """Spaces numpnts[i] energies evenly from edge[i] up to edge[i + 1] for every interval in one vectorized pass
+
+    Each interval matches np.linspace(edge[i], edge[i + 1], numpnts[i], endpoint=False). If at_end, the last
+    interval instead matches np.linspace(edge[-2], edge[-1], numpnts[-1] + 1), which ends on the last threshold,
+    or is just edge[-2] when numpnts[-1] is 0
+    """
+    total = int(numpnts.sum())
+    interval = np.repeat(np.arange(len(numpnts)), numpnts)  # which interval each energy belongs to
+    position = np.arange(total) - np.repeat(np.cumsum(numpnts) - numpnts, numpnts)  # index within its interval
+    steps = np.diff(edge) / np.maximum(numpnts, 1)
+    energies = np.empty(total + at_end)
+    np.multiply(position, steps[interval], out=energies[:total])
+    energies[:total] += edge[:-1][interval]
+    if at_end:
+        energies[-1] = edge[-1] if numpnts[-1] > 0 else edge[-2]
     return energies
 
+
+# an exposure time list parsed into its default time and (op, low, high, time) tests
+CompiledSpec = namedtuple("CompiledSpec", ["default", "tests"])
+LESS_THAN, GREATER_THAN, BETWEEN, EQUALS = range(4)
+
+# accepted names of each exposure time test
+exposure_test_ops = {
+    "less_than": LESS_THAN,
+    "less than": LESS_THAN,
+    "greater_than": GREATER_THAN,
+    "greater than": GREATER_THAN,
+    "between": BETWEEN,
+    "equals": EQUALS,
+}
+
+
+def compile_exposure_spec(exposure_time):
+    """
+    parse an exposure time list once, so it can be applied to many energy arrays without re-reading the tests
+
+    inputs:
+        exposure_time: a default value and a list of logical tests followed by their respective exposure times
+            example [1,('less_than',270),10,('between',285,288),0.1]
+
+    outputs:
+        CompiledSpec : the default exposure time and a tuple of (op, low, high, time) tests, op being one of
+            LESS_THAN, GREATER_THAN, BETWEEN or EQUALS
+    """
+    return _cached_call(_compile_exposure_spec, tuple(_hashable(item) for item in exposure_time))
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_exposure_spec(exposure_time):
+    """Cached core of compile_exposure_spec, takes the exposure time list as a tuple of tuples"""
+    tests = []
+    for test, value in zip(exposure_time[1::2], exposure_time[2::2]):
+        op = exposure_test_ops.get(test[0])
+        if op is None:
+            raise ValueError(f"Invalid test, only less_than, greater_than, and between are accepted, got {test}")
+        tests.append((op, test[1], test[2] if op == BETWEEN else None, value))
+    return CompiledSpec(float(exposure_time[0]), tuple(tests))
+
+
+def apply_exposure_spec(times, energies, spec):
+    """fill times (in place) with the exposure times that a CompiledSpec gives for each of the energies"""
+    times[:] = spec.default
+    for op, low, high, value in spec.tests:
+        if op == LESS_THAN:
+            times[energies < low] = value
+        elif op == GREATER_THAN:
+            times[energies > low] = value
+        elif op == BETWEEN:
+            times[np.logical_and(low < energies, energies < high)] = value
+        elif op == EQUALS:
+            times[low == energies] = value
+
+
 # TODO docs
 def construct_exposure_times(energies, exposure_time=1, repeats=1, quiet=False):
     """
@@ -254,42 +388,30 @@ def construct_exposure_times(energies, exposure_time=1, repeats=1, quiet=False):
             (number) set all exposure times to this default value
             (list) assume this is a default value and a list of logical tests followed by their respective exposure times
                 example [1,('less_than',270),10,('between',285,288),0.1]  the only logical operators allowed are "less_than", "between", "equals", and "greater_than"
+            (CompiledSpec) a list as above already parsed by compile_exposure_spec
 
     outputs:
         times : an array the same length of energies with exposure times
         time : the seconds estimated for the scan
     """
-    if 1 > int(repeats) or 100 < int(repeats):
+    if not 1 <= int(repeats) <= 100:
         raise ValueError("repeats must be a positive integer between 0 and 100")
     if not isinstance(energies, np.ndarray):
         raise ValueError("Invalid list of energies")
-    times = energies.copy()
     if exposure_time == "":
         exposure_time = 1
-    if isinstance(exposure_time, (float, int)):
-        times[:] = float(exposure_time)
-    elif isinstance(exposure_time, (list, redis_json_dict.redis_json_dict.ObservableSequence)):
-        times[:] = float(exposure_time[0])
-        for test, value in zip(exposure_time[1::2], exposure_time[2::2]):
-            if test[0] in ["less_than", "less than"]:
-                times[energies < test[1]] = value
-                # print(f"testing if energies are less than {test[1]} and setting them to {value}")
-            elif test[0] in ["greater_than", "greater than"]:
-                times[energies > test[1]] = value
-                # print(f"testing if energies are greater than {test[1]} and setting them to {value}")
-            elif test[0] == "between":
-                times[(test[1] < energies) * (energies < test[2])] = value
-                # print(f"testing if energies are between {test[1]} and {test[2]} and setting them to {value}")
-            elif test[0] == "equals":
-                times[test[1] == energies] = value
-                # print(f"testing if energies are equal to {test[1]} and setting them to {value}")
-            else:
-                raise ValueError(
-                    f"Invalid test, only less_than, greater_than, and between are accepted, got {test}"
-                )
+    if isinstance(exposure_time, (float, int, np.number)):
+        times = np.full_like(energies, float(exposure_time), dtype=np.float64)
+    elif isinstance(exposure_time, (list, redis_json_dict.redis_json_dict.ObservableSequence, CompiledSpec)):
+        if not isinstance(exposure_time, CompiledSpec):
+            exposure_time = compile_exposure_spec(exposure_time)
+        times = np.empty_like(energies, dtype=np.float64)  # every element is set by apply_exposure_spec
+        apply_exposure_spec(times, energies, exposure_time)
+    else:
+        raise TypeError(f"invalid exposure time {exposure_time}")
     calc_times = times * repeats
     calc_times += 1 * (repeats - 1)  # one second overhead between repeated exposures\
-    time = sum(calc_times) + 4 * len(times)
+    time = float(calc_times.sum()) + 4 * len(times)
     return times, time
 
 
@@ -304,6 +426,7 @@ def construct_exposure_times_nexafs(energies, exposure_time=1, quiet=False):
             (number) set all exposure times to this default value
             (list) assume this is a default value and a list of logical tests followed by their respective exposure times
                 example [1,('less_than',270),10,('between',285,288),0.1]  the only logical operators allowed are "less_than", "between", "equals", and "greater_than"
+            (CompiledSpec) a list as above already parsed by compile_exposure_spec
 
     outputs:
         times : an array the same length of energies with exposure times
@@ -311,30 +434,16 @@ def construct_exposure_times_nexafs(energies, exposure_time=1, quiet=False):
     """
     if not isinstance(energies, np.ndarray):
         raise ValueError("Invalid list of energies")
-    times = energies.copy()
     if exposure_time == "":
         exposure_time = 1
-    if isinstance(exposure_time, (float, int)):
-        times[:] = float(exposure_time)
-    elif isinstance(exposure_time, (list, redis_json_dict.redis_json_dict.ObservableSequence)):
-        times[:] = float(exposure_time[0])
-        for test, value in zip(exposure_time[1::2], exposure_time[2::2]):
-            if test[0] in ["less_than", "less than"]:
-                times[energies < test[1]] = value
-                # print(f"testing if energies are less than {test[1]} and setting them to {value}")
-            elif test[0] in ["greater_than", "greater than"]:
-                times[energies > test[1]] = value
-                # print(f"testing if energies are greater than {test[1]} and setting them to {value}")
-            elif test[0] == "between":
-                times[(test[1] < energies) * (energies < test[2])] = value
-                # print(f"testing if energies are between {test[1]} and {test[2]} and setting them to {value}")
-            elif test[0] == "equals":
-                times[test[1] == energies] = value
-                # print(f"testing if energies are equal to {test[1]} and setting them to {value}")
-            else:
-                raise ValueError(
-                    f"Invalid test, only less_than, greater_than, and between are accepted, got {test}"
-                )
-    calc_times = times
-    time = sum(calc_times) + .5 * len(times) # .5 seconds overhead for motor movement?  needs to be tuned
+    if isinstance(exposure_time, (float, int, np.number)):
+        times = np.full_like(energies, float(exposure_time), dtype=np.float64)
+    elif isinstance(exposure_time, (list, redis_json_dict.redis_json_dict.ObservableSequence, CompiledSpec)):
+        if not isinstance(exposure_time, CompiledSpec):
+            exposure_time = compile_exposure_spec(exposure_time)
+        times = np.empty_like(energies, dtype=np.float64)  # every element is set by apply_exposure_spec
+        apply_exposure_spec(times, energies, exposure_time)
+    else:
+        raise TypeError(f"invalid exposure time {exposure_time}")
+    time = float(times.sum()) + .5 * len(times) # .5 seconds overhead for motor movement?  needs to be tuned
     return times, time
@@ -44,6 +44,9 @@ rsoxs_scan_core    : {'detnames', 'repeats', 'temperatures', 'temps_with_locatio
 """
 
 
+# The edge, ratio, frames and speed tables below can be extended or edited at runtime. Energies and scan parameters
+# computed from them are cached, so call rsoxs_scans.constructor.clear_caches() after changing existing entries.
+
 # look up table for aliases of edges
 edge_names = {
     "c": "carbon",
@@ -152,6 +155,19 @@ nexafs_speed_table = {
     "very slow": 0.05,
 }
 
+
+def lookup_edge(name, edges):
+    """Resolves an edge name or alias, in any case, to (edge name, thresholds) in edges, or None if it isn't there
+
+    The tables are read on every call, so edges and aliases added to them at runtime are found
+    """
+    name = name.lower()
+    name = edge_names.get(name, name)
+    if name in edges:
+        return name, edges[name]
+    return None
+
+
 # List of Valid Measurement Configurations
 config_list = [
     "WAXSNEXAFS",
@@ -27,16 +27,21 @@ def nexafs_scan_enqueue(
     # validate inputs
     valid = True
     validation = ""
-    energies = np.empty(0)
-    speeds = []
-    for scanparam in scan_params:
-        (sten, enden, speed) = scanparam
-        energies = np.append(energies, np.linspace(sten, enden, 10))
-        speeds.append(speed)
+    # read the (start, end, speed) segments as columns and sample every segment at once
+    try:
+        segments = np.asarray(scan_params, dtype=np.float64)
+    except (TypeError, ValueError):  # ragged or non-numeric segments
+        segments = np.empty(0)
+    if segments.ndim == 2 and segments.shape[1] == 3:
+        starts, ends = segments[:, 0], segments[:, 1]
+        speeds = [segment[2] for segment in scan_params]  # as given, so the description shows them unchanged
+        energies = np.linspace(starts, ends, 10, axis=-1).ravel()
+    else:  # anything else is reported below, rather than regrouped into segments
+        energies = speeds = np.empty(0)
     if len(energies) < 10:
         valid = False
         validation += f"scan parameters {scan_params} could not be parsed\n"
-    if min(energies) < 70 or max(energies) > 2200:
+    elif min(energies) < 70 or max(energies) > 2200:
         valid = False
         validation += "energy input is out of range for SST 1\n"
     if not isinstance(cycles, (int, float)):
@@ -46,15 +51,15 @@ def nexafs_scan_enqueue(
         valid = False
         validation += f"invalid cycles number {cycles}\n"
     if grating in ["1200", 1200]:
-        if min(energies) < 150:
+        if len(energies) and min(energies) < 150:
             valid = False
             validation += "energy is to low for the 1200 l/mm grating\n"
     elif grating in ["250", 250]:
-        if max(energies) > 1300:
+        if len(energies) and max(energies) > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     elif grating == "rsoxs":
-        if max(energies) > 1300:
+        if len(energies) and max(energies) > 1300:
             valid = False
             validation += "energy is too high for 250 l/mm grating\n"
     else:
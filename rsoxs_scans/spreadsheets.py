@@ -4,11 +4,13 @@ Contains code to parse excel sheet for bar (list of sample dict), export parsed
 """
 
 # imports
-from copy import deepcopy
-from openpyxl import load_workbook
-from openpyxl.writer import excel
+from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from openpyxl import Workbook, load_workbook
 from pathlib import Path
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import json, orjson
 import re, warnings, httpx, uuid
 import numpy as np
@@ -20,11 +22,18 @@ from .defaults import (
     edge_names,
     config_list,
     current_version,
+    lookup_edge,
     rsoxs_edges,
     nexafs_edges,
     CURRENT_CYCLE,
 )
 
+# line breaks inside a cell would break the rows of a wiki table
+_WIKI_TRANSLATION = str.maketrans({"\r": " ", "\n": " "})
+
+# proposal ids, with or without a "GU-", "PU-", "pass-", or "C-" prefix
+_PROPOSAL_RE = re.compile(r"^[GUCPpass]*-?(?P<proposal_number>\d+)$")
+
 
 def load_samplesxlsx(filename: str, verbose=False):
     """Imports data from sample excel spreadsheet and online sources to generate bar (list of sample dicts)
@@ -42,8 +51,10 @@ def load_samplesxlsx(filename: str, verbose=False):
         bar (list of sample dicts) which contain all imported data from the Bar sheet and Acquisitions sheet
     """
 
+    # Load the workbook once, the version check and every sheet read below share this handle
+    excel_file = load_workbook(filename, read_only=True, data_only=True)
+
     # Validate Spreadsheet Version Number
-    excel_file = load_workbook(filename)
     print(f"spreadsheet version is {excel_file.properties.title}")
     if excel_file.properties.title != current_version:
         excel_file.close()
@@ -51,208 +62,142 @@ def load_samplesxlsx(filename: str, verbose=False):
             "this excel file is not the current version, we read{.  please upgrade your template"
             " and try again"
         )
-    excel_file.close()
+    # openpyxl warns about excel features it doesn't support (like data validation), which don't matter here
+    with warnings.catch_warnings(), pd.ExcelFile(excel_file, engine="openpyxl") as excel_sheets:
+        warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+
+        # First, check the bar sheet for whether header rows with user instructions are present, and identity them
+        # if so
+        # If so, we can do some extra validation, but need to skip them when loading data
+        # If not, we proceed with a bit less validation and don't skip them
+        barHeaderRows = []
+        barParamsRequired = (
+            []
+        )  # if reading the header fails, this stays empty and we don't check for them
+        doImportBarHeaders = True  # stays True if the bar sheet has the Parameters'Index but no Descriptions
 
-    # First, check the bar sheet for whether header rows with user instructions are present, and identity them if so
-    # If so, we can do some extra validation, but need to skip them when loading data
-    # If not, we proceed with a bit less validation and don't skip them
-    barHeaderRows = []
-    barParamsRequired = (
-        []
-    )  # if reading the header fails, this stays empty and we don't check for them
+        try:
+            # Read just where the header rows from the bar sheet would be
+            if verbose:
+                print("Loading 'Bar' Sheet Headers")
+            barHeaderRows, barParamsRequired = _probe_header(excel_file["Bar"])
+            doImportBarHeaders = len(barHeaderRows) > 0
 
-    try:
-        # Import just where the header rows from the bar sheet would be
-        warnings.simplefilter(action="ignore", category=UserWarning)
+        except ValueError as e:
+            warnings.warn(
+                (
+                    "\nError parsing bar sheet headers, skipping some validation that needs header"
+                    f" cells: {str(e)}"
+                ),
+                stacklevel=2,
+            )
+            pass
+
+        # Then, check the Acquisitions sheet for whether header rows with user instructions are present, and
+        # identity them if so
+        # If so, we can do some extra validation, but need to skip them when loading data
+        # If not, we proceed with a bit less validation and don't skip them
+        acqHeaderRows = []
+        acqParamsRequired = (
+            []
+        )  # if reading the header fails, this stays empty and we don't check for them
+
+        try:
+            # Read just where the header rows from the Acquisitions sheet would be
+            if verbose:
+                print("Loading 'Acquisitions' Sheet Headers")
+            # Only sheets with bar headers have them in Acquisitions too, exported sheets keep a bare index there
+            if doImportBarHeaders:
+                acqHeaderRows, acqParamsRequired = _probe_header(excel_file["Acquisitions"])
+
+        except ValueError as e:
+            warnings.warn(
+                (
+                    "\nError parsing Acquisitions sheet headers, skipping some validation that needs"
+                    f" header cells: {str(e)}"
+                ),
+                stacklevel=2,
+            )
+            pass
+
+        # Import Bar sheet data cells as a dataframe
         if verbose:
-            print("Loading 'Bar' Sheet Headers")
-        df_barHeader = pd.read_excel(
-            filename,
+            print("Loading 'Bar' Sheet Data")
+        df_bar = pd.read_excel(
+            excel_sheets,
             na_values="",
-            engine="openpyxl",
             keep_default_na=True,
             converters={"sample_date": str},
             sheet_name="Bar",
-            nrows=4,
-            verbose=verbose,
+            skiprows=barHeaderRows,
         )
 
-        # Check if the first cell has the Parameters'Index
-        if "Parameter/ Index" in df_barHeader.keys():
-            doImportBarHeaders = True
-        else:  # Dont attempt to import header and warn user that we will skip some cell validation
-            doImportBarHeaders = False
-            # warnings.resetwarnings()
-            # warnings.warn(
-            #    "\nDidn't find Parameter/ Index column in bar sheet, skipping some validation that needs header cells"
-            # )
-
-        # Load the header data
-        if doImportBarHeaders:
-            # Check where we actually have the header rows. Mark them to be skipped when loading data.
-            if df_barHeader["Parameter/ Index"][0] != "Description":
-                raise ValueError("Couldn't find parameter Descriptions")
-            else:
-                barHeaderRows.append(1)
-            if (
-                len(df_barHeader["Parameter/ Index"]) > 1
-                and df_barHeader["Parameter/ Index"][1] == "Rules"
-            ):
-                barHeaderRows.append(2)
-            if (
-                len(df_barHeader["Parameter/ Index"]) > 2
-                and df_barHeader["Parameter/ Index"][2] == "Example"
-            ):
-                barHeaderRows.append(3)
-            if (
-                len(df_barHeader["Parameter/ Index"]) > 3
-                and df_barHeader["Parameter/ Index"][3] == "Notes"
-            ):
-                barHeaderRows.append(4)
-
-            # Cast as a nested dict, where:
-            dict_barHeader = df_barHeader.to_dict(orient="index")
-
-            # Make a list of bar parameters that are marked 'REQUIRED'
-            barParamsRequired = []
-            for param in dict_barHeader[0]:
-                if "REQUIRED" in dict_barHeader[0][param]:
-                    barParamsRequired.append(param)
-
-    except ValueError as e:
-        warnings.resetwarnings()
-        warnings.warn(
-            (
-                "\nError parsing bar sheet headers, skipping some validation that needs header"
-                f" cells: {str(e)}"
-            ),
-            stacklevel=2,
-        )
-        pass
-
-    # Then, check the Acquisitions sheet for whether header rows with user instructions are present, and identity them if so
-    # If so, we can do some extra validation, but need to skip them when loading data
-    # If not, we proceed with a bit less validation and don't skip them
-    acqHeaderRows = []
-    acqParamsRequired = (
-        []
-    )  # if reading the header fails, this stays empty and we don't check for them
-
-    try:
-        # Import just where the header rows from the Acquisitions sheet would be
-        warnings.simplefilter(action="ignore", category=UserWarning)
+        # Import Acquisitions sheet data cells as a dataframe
         if verbose:
-            print("Loading 'Acquisitions' Sheet Headers")
-        df_acqHeader = pd.read_excel(
-            filename,
+            print("Loading 'Acquisitions' Sheet Data")
+        df_acqs = pd.read_excel(
+            excel_sheets,
             na_values="",
-            engine="openpyxl",
             keep_default_na=True,
-            converters={"sample_date": str},
             sheet_name="Acquisitions",
-            nrows=4,
-            verbose=verbose,
+            skiprows=acqHeaderRows,
         )
 
-        # Check if the first cell has the Parameters'Index
-        if "Parameter/ Index" in df_acqHeader.keys():
-            doImportAcqHeaders = True
-        else:  # Dont attempt to import header and warn user that we will skip some cell validation
-            doImportAcqHeaders = False
-            # warnings.resetwarnings()
-            # warnings.warn(
-            #    "\nDidn't find Parameter/ Index column in acq sheet, skipping some validation that needs header cells"
-            # )
-
-        # Load the header data
-        if doImportBarHeaders:
-            # Check where we actually have the header rows. Mark them to be skipped when loading data.
-            if df_acqHeader["Parameter/ Index"][0] != "Description":
-                raise ValueError("Couldn't find parameter Descriptions")
-            else:
-                acqHeaderRows.append(1)
-            if (
-                len(df_acqHeader["Parameter/ Index"]) > 1
-                and df_acqHeader["Parameter/ Index"][1] == "Rules"
-            ):
-                acqHeaderRows.append(2)
-            if (
-                len(df_acqHeader["Parameter/ Index"]) > 2
-                and df_acqHeader["Parameter/ Index"][2] == "Example"
-            ):
-                acqHeaderRows.append(3)
-            if (
-                len(df_acqHeader["Parameter/ Index"]) > 3
-                and df_acqHeader["Parameter/ Index"][3] == "Notes"
-            ):
-                acqHeaderRows.append(4)
-
-            # Cast as a nested dict, where:
-            dict_acqHeader = df_acqHeader.to_dict(orient="index")
-
-            # Make a list of acq parameters that are marked 'REQUIRED'
-            acqParamsRequired = []
-            for param in dict_acqHeader[0]:
-                if "REQUIRED" in dict_acqHeader[0][param]:
-                    acqParamsRequired.append(param)
-
-    except ValueError as e:
-        warnings.resetwarnings()
-        warnings.warn(
-            (
-                "\nError parsing Acquisitions sheet headers, skipping some validation that needs"
-                f" header cells: {str(e)}"
-            ),
-            stacklevel=2,
-        )
-        pass
-
-    # Import Bar sheet data cells as a dataframe
-    if verbose:
-        print("Loading 'Bar' Sheet Data")
-    warnings.simplefilter(action="ignore", category=UserWarning)
-    df_bar = pd.read_excel(
-        filename,
-        na_values="",
-        engine="openpyxl",
-        keep_default_na=True,
-        converters={"sample_date": str},
-        sheet_name="Bar",
-        skiprows=barHeaderRows,
-        verbose=verbose,
+    # Get rid of the stupid unnamed columns thrown in by pandas, and the index column of the header rows
+    df_bar.drop(
+        columns=[key for key in df_bar.columns if "named" in str(key).lower() or "Index" in str(key)],
+        inplace=True,
     )
 
     # Replace NaNs with empty string
-    df_bar.replace(np.nan, "", regex=True, inplace=True)
+    df_bar = df_bar.fillna("")
 
     # Convert dataframe to a list of dictionaries, each row is a list element and each column is a key->value pair
-    new_bar = df_bar.to_dict(orient="records")
+    new_bar = _fast_records(df_bar)
 
     # if the bar has one element, force to a list
     if not isinstance(new_bar, list):
         new_bar = [new_bar]
 
     # blank out any acquisitions elements which might be there (they shouldn't be there unless someone added a column for some reason
+    # and index the samples by sample_id, where the first sample with a sample_id takes its acquisitions
+    sample_by_id = {}
     for samp in new_bar:
         samp["acquisitions"] = []
+        sample_by_id.setdefault(samp["sample_id"], samp)
 
-    # Import Acquisitions sheet data cells as a dataframe
-    if verbose:
-        print("Loading 'Acquisitions' Sheet Data")
-    df_acqs = pd.read_excel(
-        filename,
-        na_values="",
-        engine="openpyxl",
-        keep_default_na=True,
-        sheet_name="Acquisitions",
-        skiprows=acqHeaderRows,
-        verbose=True,
-    )
+    # Sanitize the text cells one column at a time, numeric and boolean columns hold no strings
+    for column in df_acqs.select_dtypes(exclude=["number", "bool"]).columns:
+        df_acqs[column] = df_acqs[column].map(_sanitize_cell, na_action="ignore")
+
+    # Check if values were provided for all 'REQUIRED' acquisition cells, empty cells are stored as np.nan
+    missing_values = df_acqs[[key for key in df_acqs.columns if key in acqParamsRequired]].isna()
+    incomplete_acqs = np.flatnonzero(missing_values.any(axis=1))
+    if len(incomplete_acqs) > 0:
+        i = incomplete_acqs[0]  # report the first acquisition with missing values
+        raise ValueError(
+            f"Acquisition #{i}, sample_id:{df_acqs['sample_id'].iloc[i]} is missing REQUIRED Parameters: "
+            + "".join(f"{key}, " for key in missing_values.columns[missing_values.iloc[i]])
+        )
 
-    # acqsdf.replace(np.nan, "", regex=True, inplace=True)
+    # Replace NaNs with empty string, empty cells are dropped from each acquisition below
+    df_acqs = df_acqs.fillna("")
+
+    # Encapsulate single-element values into lists
+    for column in ["polarizations", "angles", "temperatures"]:
+        if column in df_acqs:
+            df_acqs[column] = df_acqs[column].map(_encapsulate_number)
+
+    # Sanitize group and grating
+    if "group" in df_acqs:
+        df_acqs["group"] = df_acqs["group"].map(str)
+    if "grating" in df_acqs:
+        df_acqs["grating"] = df_acqs["grating"].map(
+            lambda grating: int(grating) if isinstance(grating, float) else grating
+        )
 
     # Convert dataframe to a list of dictionaries, each row is a list element and each column is a key->value pair
-    acqs = df_acqs.to_dict(orient="records")
+    acqs = _fast_records(df_acqs)
 
     # if the acqs has one element, force to a list
     if not isinstance(acqs, list):
@@ -263,44 +208,10 @@ def load_samplesxlsx(filename: str, verbose=False):
     acq = {}
     # Loop through acquisitions and sanitize / validate user input
     for i, acq in enumerate(acqs):
-        # Loop through columns in the acquisition sheet and sanitize strings
-        for key in acq:
-            # If cell holds a string, for to square brackets and single quotes
-            if isinstance(acq[key], str):
-                acq[key] = acq[key].replace("(", "[").replace(")", "]").replace("'", '"')
-                # Try to parse values
-                try:
-                    acq[key] = json.loads(acq[key])
-                except:
-                    pass  ### TODO handle this?
-            if isinstance(acq[key], str):
-                if "," in acq[key]:  # if the string looks like a list
-                    try:
-                        acq[key] = [
-                            float(num) for num in acq[key].split(",")
-                        ]  # cast it as a list of floating point numbers instead
-                    except:
-                        pass
-
-        # Check if values were provided for all 'REQUIRED' acquisition cells for this acq
-        missedVal = False
-        missingValText = (
-            f"Acquisition #{i}, sample_id:{acq['sample_id']} is missing REQUIRED Parameters: "
-        )
-        for key in acq:  # Loop through all columns for this acquisition
-            # first check if required cell, then whether it is empty
-            # Empty cells are cells are stored as np.nan. isnan cant evaluate on all datatypes though
-            if key in acqParamsRequired and isinstance(acq[key], float) and np.isnan(acq[key]):
-                missingValText += f"{key}, "
-                missedVal = True
-        if missedVal:
-            raise ValueError(missingValText)
-
         # get the sample that corresponds to the sample_id for this acq... the first one that matches it takes
         try:
-            samp = next(dict for dict in new_bar if dict["sample_id"] == acq["sample_id"])
-        except StopIteration:
-            pass
+            samp = sample_by_id[acq["sample_id"]]
+        except (KeyError, TypeError):  # TypeError if the sample_id was parsed into a list
             missingSampText = (
                 f'ERROR acquisition #{i} needs a sample_id "{acq["sample_id"]}" which was not'
                 " found - please check your sample_ids"
@@ -316,9 +227,7 @@ def load_samplesxlsx(filename: str, verbose=False):
             pass
         if isinstance(acq["edge"], str):
             if "," in acq["edge"]:  # if the string looks like a list
-                acq["edge"] = [
-                    float(num) for num in acq["edge"].split(",")
-                ]  # cast it as a list of floating point numbers instead
+                acq["edge"] = _parse_float_list(acq["edge"])  # cast it as a list of floating point numbers instead
 
         # Validate based on scan type
         # Validate RSoXS
@@ -331,11 +240,10 @@ def load_samplesxlsx(filename: str, verbose=False):
                 )
             # Validate rsoxs edge
             if not isinstance(acq.get("edge", "c"), (tuple, list, int, float)):
-                if not str(acq.get("edge", "c")).lower() in nexafs_edges.keys():
-                    if not edge_names[str(acq.get("edge", "c")).lower()] in rsoxs_edges.keys():
-                        raise ValueError(
-                            f'{acq["edge"]} on line {i} is not a valid edge for an rsoxs scan'
-                        )
+                if lookup_edge(str(acq.get("edge", "c")), rsoxs_edges) is None:
+                    raise ValueError(
+                        f'{acq["edge"]} on line {i} is not a valid edge for an rsoxs scan'
+                    )
         # Validate NEXAFS
         elif acq["type"].lower() == "nexafs":
             # Validate nexafs configuration
@@ -346,11 +254,10 @@ def load_samplesxlsx(filename: str, verbose=False):
                 )
             # Validate nexafs edge
             if not isinstance(acq.get("edge", "c"), (tuple, list)):
-                if not str(acq.get("edge", "c")).lower() in nexafs_edges.keys():
-                    if not edge_names[str(acq.get("edge", "c")).lower()] in nexafs_edges.keys():
-                        raise ValueError(
-                            f'{acq["edge"]} on line {i} is not a valid edge for a nexafs scan'
-                        )
+                if lookup_edge(str(acq.get("edge", "c")), nexafs_edges) is None:
+                    raise ValueError(
+                        f'{acq["edge"]} on line {i} is not a valid edge for a nexafs scan'
+                    )
 
         # Validate step NEXAFS
         elif acq["type"].lower() == "nexafs":
@@ -367,28 +274,11 @@ def load_samplesxlsx(filename: str, verbose=False):
                         f'{acq["edge"]} on line {i} is not a valid edge for a nexafs scan'
                     )
 
-        # Encapsulate single-element values into lists
-        if "polarizations" in acq:
-            if isinstance(acq["polarizations"], (int, float)):
-                acq["polarizations"] = [acq["polarizations"]]
-        if "angles" in acq:
-            if isinstance(acq["angles"], (int, float)):
-                acq["angles"] = [acq["angles"]]
-        if "temperatures" in acq:
-            if isinstance(acq["temperatures"], (int, float)):
-                acq["temperatures"] = [acq["temperatures"]]
-
-        # Sanitize Group
-        if not isinstance(acq.get("group", 0), str):
-            acq["group"] = str(acq.get("group", ""))
+        # Empty groups are dropped with the other empty cells, every acquisition needs one
+        acq.setdefault("group", "")
         acq["uid"] = str(uuid.uuid1())
         samp["acquisitions"].append(acq)
 
-        # sanatize grating
-        if "grating" in acq:
-            if isinstance(acq["grating"], (float)):
-                acq["grating"] = int(acq["grating"])
-
         # Validate Acquisition Parameters by Value and issue warnings if out of bounds
         invalidAcqParam = False  # False means none invalid
         invalidAcqParamText = (
@@ -452,34 +342,32 @@ def load_samplesxlsx(filename: str, verbose=False):
     if verbose:
         print("Started Parsing Bar Data")
 
+    # Check if values were provided for all 'REQUIRED' bar cells, empty cells are stored as empty strings
+    missing_values = df_bar[[key for key in df_bar.columns if key in barParamsRequired]] == ""
+    incomplete_samples = np.flatnonzero(missing_values.any(axis=1))
+    if len(incomplete_samples) > 0:
+        i = incomplete_samples[0]  # report the first sample with missing values
+        raise ValueError(
+            f"Bar Entry #{i}, sample_id: {new_bar[i]['sample_id']} is missing REQUIRED Parameters: "
+            + "".join(f"{key}, " for key in missing_values.columns[missing_values.iloc[i]])
+        )
+
+    # Query the PASS database for every proposal on the bar up front, samples usually share a few proposals
+    proposal_lookups = _lookup_proposals(
+        {
+            str(sam["proposal_id"]) if "proposal_id" in sam else sam.get("data_session", 0)
+            for sam in new_bar
+        }
+    )
+
     # Loop through samples in Bar and sanitize / validate user input
     for i, sam in enumerate(new_bar):
         # Handle the autogenerated columns,
-        if sam.get("location", "") == "":
-            new_bar[i]["location"] = "[]"
-        new_bar[i]["location"] = json.loads(sam.get("location", "[]").replace("'", '"'))
-        if sam.get("bar_loc", "") == "":
-            new_bar[i]["bar_loc"] = "{}"
-        new_bar[i]["bar_loc"] = json.loads(sam.get("bar_loc", "{}").replace("'", '"'))
-        if sam.get("acq_history", "") == "":
-            new_bar[i]["acq_history"] = "[]"
-        new_bar[i]["acq_history"] = json.loads(
-            sam.get("acq_history", "[]").replace("'", '"').rstrip('\\"').lstrip('\\"')
-        )
-
-        # Check if values were provided for all 'REQUIRED' bar cells for this sample_id
-        missedVal = False
-        missingValText = (
-            f"Bar Entry #{i}, sample_id: {sam['sample_id']} is missing REQUIRED Parameters: "
+        new_bar[i]["location"] = _parse_cell_literal(sam.get("location", ""), [], "location", sam["sample_id"])
+        new_bar[i]["bar_loc"] = _parse_cell_literal(sam.get("bar_loc", ""), {}, "bar_loc", sam["sample_id"])
+        new_bar[i]["acq_history"] = _parse_cell_literal(
+            sam.get("acq_history", "").strip('\\"\''), [], "acq_history", sam["sample_id"]
         )
-        for key in sam:  # Loop through all columns for this acquisition
-            # first check if required cell, then whether it is empty
-            # Empty cells are stored as empty strings
-            if key in barParamsRequired and sam[key] == "":
-                missingValText += f"{key}, "
-                missedVal = True
-        if missedVal:
-            raise ValueError(missingValText)
 
         # Validate Bar Parameters by Value and issue warnings if out of bounds
         invalidAcqParam = False  # False means none invalid
@@ -554,11 +442,9 @@ def load_samplesxlsx(filename: str, verbose=False):
             )
             proposal = 0
 
-        # Query the PASS database for values
+        # Use the values queried from the PASS database (a failed lookup is stored as None)
         try:
-            sam["data_session"], sam["analysis_dir"], sam["SAF"], sam["proposal"] = (
-                get_proposal_info(proposal)
-            )
+            sam["data_session"], sam["analysis_dir"], sam["SAF"], sam["proposal"] = proposal_lookups[proposal]
         except:
             warnings.warn("PASS lookup failed - trusting values", stacklevel=2)
             pass
@@ -570,15 +456,170 @@ def load_samplesxlsx(filename: str, verbose=False):
         new_bar[i]["bar_loc"]["spot"] = sam["bar_spot"]
         new_bar[i]["bar_loc"]["th"] = sam["angle"]
 
-        # Get rid of the stupid unnamed columns thrown in by pandas
-        for key in [key for key, value in sam.items() if "named" in key.lower() or "Index" in key]:
-            del new_bar[i][key]
-
     if verbose:
         print("Bar and Acquisitions Sheets Loaded")
     return new_bar
 
 
+# translation from python style tuples and quotes to json
+_JSON_TRANSLATION = str.maketrans({"(": "[", ")": "]", "'": '"'})
+
+
+def _fast_records(df):
+    """Converts a DataFrame into a list of row dicts, like df.to_dict(orient="records")
+
+    Each column is converted to python values at once with tolist, instead of boxing every cell separately.
+    Numpy numbers and booleans stored in object columns are unboxed with item(), as to_dict does.
+    """
+    columns = list(df.columns)
+    values = []
+    for j in range(len(columns)):
+        column = df.iloc[:, j].tolist()
+        if df.dtypes.iloc[j] == object:  # tolist only unboxes the values of numpy typed columns
+            column = [
+                value.item() if isinstance(value, (np.integer, np.floating, np.bool_)) else value
+                for value in column
+            ]
+        values.append(column)
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _encapsulate_number(value):
+    """Wraps a single number in a list, like a single angle given instead of a list of angles"""
+    if isinstance(value, (int, float)):
+        return [value]
+    return value
+
+
+def _sanitize_cell(value):
+    """Parses a text cell of the Acquisitions sheet into python values where possible
+
+    The text is parsed as json after swapping parentheses for square brackets and single quotes for double
+    quotes. Text that still looks like a list (contains a comma) is cast as a list of floating point numbers.
+    Anything that can't be parsed is returned as the (translated) text, non-text values are returned unchanged.
+    """
+    if not isinstance(value, str):
+        return value
+    value = value.translate(_JSON_TRANSLATION)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass  ### TODO handle this?
+    if isinstance(value, str) and "," in value:  # if the string looks like a list
+        try:
+            value = _parse_float_list(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_float_list(text):
+    """Casts comma separated text, like "250, 270.5, 300", as a list of floating point numbers
+
+    Raises ValueError if any of the entries is not a number.
+    """
+    return list(map(float, text.split(",")))
+
+
+def _parse_cell_literal(text, default, column, sample_id):
+    """Parses a generated cell of the Bar sheet, like location, bar_loc, or acq_history
+
+    Cells are written as json, or as python literals which may use single quotes. Empty cells give default.
+    Cells that can't be parsed raise ValueError naming the column and sample_id.
+    """
+    if text == "":
+        return default
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(text.replace("'", '"'))
+    except ValueError:
+        pass
+    try:
+        return literal_eval(text)  # python literals that aren't json once quoted, like True or None
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(f"{column} of sample_id:{sample_id} could not be parsed: {text}") from e
+
+
+def _probe_header(ws):
+    """Finds the user instruction rows (Description, Rules, Example, Notes) below the header of a sheet
+
+    Only the first five rows of the sheet are read.
+
+    Parameters
+    ----------
+    ws : openpyxl worksheet
+        the Bar or Acquisitions sheet of the sample spreadsheet
+
+    Returns
+    -------
+    tuple (header_rows, required_params)
+        the sheet rows holding instructions, which need to be skipped when loading data, and the list of
+        parameters whose Description is marked 'REQUIRED'. Both are empty if the sheet has no instruction rows
+    """
+    ws.reset_dimensions()  # the dimensions stored in the file are not always reliable
+    rows = list(islice(ws.iter_rows(values_only=True), 5))
+
+    # Check if the first row has the Parameters'Index column
+    if not rows or "Parameter/ Index" not in rows[0]:
+        return [], []
+    index_column = rows[0].index("Parameter/ Index")
+    labels = [row[index_column] if index_column < len(row) else None for row in rows[1:]]
+
+    # Check where we actually have the header rows. Mark them to be skipped when loading data.
+    if not labels or labels[0] != "Description":
+        raise ValueError("Couldn't find parameter Descriptions")
+    header_rows = [1]
+    for row_number, label in enumerate(("Rules", "Example", "Notes"), start=2):
+        if len(labels) >= row_number and labels[row_number - 1] == label:
+            header_rows.append(row_number)
+
+    # Make a list of parameters that are marked 'REQUIRED', blank descriptions are skipped
+    required_params = [
+        param
+        for param, description in zip(rows[0], rows[1])
+        if isinstance(description, str) and "REQUIRED" in description
+    ]
+    return header_rows, required_params
+
+
+@lru_cache(maxsize=None)
+def _pass_client():
+    """Client for the PASS api, made on first use and then kept so that lookups reuse open connections"""
+    #return httpx.Client(base_url="https://api-staging.nsls2.bnl.gov")
+    return httpx.Client(base_url="https://api.nsls2.bnl.gov")
+
+
+def _lookup_proposals(proposals, max_workers=8):
+    """Runs get_proposal_info for several proposals concurrently
+
+    Parameters
+    ----------
+    proposals : iterable
+        distinct proposal ids (or data sessions) to look up
+    max_workers : int, optional
+        the most requests to have in flight at once, by default 8
+
+    Returns
+    -------
+    dict
+        the get_proposal_info result for each proposal, or None where the lookup failed
+    """
+
+    def lookup(proposal):
+        try:
+            return get_proposal_info(proposal)
+        except Exception:
+            return None
+
+    proposals = list(proposals)
+    _pass_client()  # make the shared client before the threads need it
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(proposals, pool.map(lookup, proposals)))
+
+
 def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CURRENT_CYCLE):
     """Query the api PASS database, and get the info corresponding to a proposal ID
 
@@ -604,13 +645,11 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
         " suggested that you fix this \n if you are running this outside of the NSLS-II network,"
         " this is expected"
     )
-    proposal_re = re.compile(r"^[GUCPpass]*-?(?P<proposal_number>\d+)$")
     if isinstance(proposal_id, str):
-        proposal = proposal_re.match(proposal_id).group("proposal_number")
+        proposal = _PROPOSAL_RE.match(proposal_id).group("proposal_number")
     else:
         proposal = proposal_id
-    #pass_client = httpx.Client(base_url="https://api-staging.nsls2.bnl.gov")
-    pass_client = httpx.Client(base_url="https://api.nsls2.bnl.gov")
+    pass_client = _pass_client()
     responce = pass_client.get(f"/v1/proposal/{proposal}")
     #print(responce.json())
     res = responce.json()['proposal']
@@ -619,7 +658,6 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
         warnings.warn(
             f"proposal {proposal} does not appear to have any safs" + warn_text, stacklevel=2
         )
-        pass_client.close()
         return None, None, None, None
     comissioning = 1
     if "cycles" in res:
@@ -628,7 +666,6 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
             warnings.warn(
                 f"proposal {proposal} is not valid for the {cycle} cycle" + warn_text, stacklevel=2
             )
-            pass_client.close()
             return None, None, None, None
     elif "Commissioning" not in res["type"]:
         warnings.warn(
@@ -637,14 +674,12 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
             + warn_text,
             stacklevel=2,
         )
-        pass_client.close()
         return -1
     if len(res["safs"]) < 0:
         warnings.warn(
             f"proposal {proposal} does not have a valid SAF in the system" + warn_text,
             stacklevel=2,
         )
-        pass_client.close()
         return None, None, None, None
     valid_SAF = ""
     for saf in res["safs"]:
@@ -656,14 +691,12 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
             + warn_text,
             stacklevel=2,
         )
-        pass_client.close()
         return None, None, None, None
     proposal_info = res
     dir_responce = pass_client.get(f"/v1/proposal/{proposal}/directories")
     dir_res = dir_responce.json()['directories']
     if len(dir_res) < 1:
         warnings.warn(f"proposal{proposal} have any directories" + warn_text, stacklevel=2)
-        pass_client.close()
         return None, None, None, None
     valid_path = ""
     for dir in dir_res:
@@ -676,10 +709,8 @@ def get_proposal_info(proposal_id, beamline="SST1", path_base="/sst/", cycle=CUR
             + warn_text,
             stacklevel=2,
         )
-        pass_client.close()
         return None, None, None, None
 
-    pass_client.close()
     return res["data_session"], valid_path, valid_SAF, proposal_info
 
 
@@ -724,19 +755,12 @@ def save_samplesxlsx(bar, name="", path=""):
     for i, sam in enumerate(bar):
         for acq in sam["acquisitions"]:
             acq.update({"sample_id": sam["sample_id"]})
-            cleanacq = deepcopy(empty_acq) ## Sorting the acquisition parameters into a format that can be entered into the spreadsheet
-            for key in acq:
-                cleanacq[key] = acq[key]
-                """
-                if isinstance(acq[key], (str)):
-                    cleanacq[key] = acq[key]
-                else:
-                    cleanacq[key] = orjson.dumps(dict(acq[key])) #cleanacq[key] = json.dumps(acq[key]) ## This is causing JSON serialization issues
-                """
+            # Sorting the acquisition parameters into a format that can be entered into the spreadsheet
+            # the values are only read from here on, so a shallow copy of the defaults is enough
+            cleanacq = {**empty_acq, **acq}
             acqlist.append(cleanacq)
     sampledf = pd.DataFrame.from_dict(bar, orient="columns")
-    df_bar = deepcopy(sampledf)
-    testdict = df_bar.to_dict(orient="records")
+    testdict = sampledf.to_dict(orient="records")  # new dicts, so the bar itself isn't modified below
     cleanbar = []
     for i, sam in enumerate(testdict):
         if "acq_history" not in testdict[i].keys():
@@ -744,21 +768,42 @@ def save_samplesxlsx(bar, name="", path=""):
         elif isinstance(testdict[i]["acq_history"], str):
             testdict[i]["acq_history"] = []
         del testdict[i]["acquisitions"]
-        cleansam = deepcopy(empty_sample)
-        cleansam.update(testdict[i])
-        cleanbar.append(cleansam)
+        cleanbar.append({**empty_sample, **testdict[i]})
 
     sampledf = pd.DataFrame.from_dict(cleanbar, orient="columns")
     acqdf = pd.DataFrame.from_dict(acqlist, orient="columns")
-    writer = pd.ExcelWriter(filename)
-    sampledf.to_excel(writer, index=False, sheet_name="Bar")
-    acqdf.to_excel(writer, index=False, sheet_name="Acquisitions")
-    writer.close()
-
-    excel_file = load_workbook(filename)
-    excel_file.properties.title = current_version
-    excel.save_workbook(excel_file, filename)
-    excel_file.close()
+    # Stream the rows into a write-only workbook, there is no styling to keep so pandas' writer isn't needed
+    workbook = Workbook(write_only=True)
+    workbook.properties.title = current_version
+    for sheet_name, df in (("Bar", sampledf), ("Acquisitions", acqdf)):
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index=False, name=None):
+            sheet.append([_excel_value(value) for value in row])
+    workbook.save(filename)
+
+
+def _excel_value(value):
+    """Converts a value of the bar into a value for an excel cell, the same way pandas' to_excel does
+
+    Empty values give an empty cell, numbers, booleans, and dates are kept, and anything else (like the lists
+    and dicts of the bar) is written as its string.
+    """
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        if np.isinf(value):
+            return "inf" if value > 0 else "-inf"
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds() / 86400
+    if isinstance(value, date):  # datetimes included
+        return value
+    return str(value)
 
 
 def convertSampleSheetExcelMediaWiki(
@@ -814,16 +859,17 @@ def convertSampleSheetExcelMediaWiki(
     ]
 
     ## Extract Version Code as a string
-    versionStr = load_workbook(excelSheet).properties.title
+    excel_file = load_workbook(excelSheet, read_only=True, data_only=True)  # opened once for all of the reads
+    versionStr = excel_file.properties.title
     # print(versionStr)
 
     ## Get Current Date
     date.today()
 
     ## Add Wiki Page Header to Output string
-    outStr = (
+    outParts = [  # the output is collected as a list of pieces and joined once at the end
         f"== SST-1 Sample Sheet Syntax Version: {versionStr} Last Updated: {date.today()} ==\n"
-    )
+    ]
     if verbose:
         print(f"Pass!\n\t\tVersion Number is -> {versionStr}")
 
@@ -840,13 +886,14 @@ def convertSampleSheetExcelMediaWiki(
     ## Convert column bounds to string
     colString = startColumn_Params + ":" + endColumn_Params
 
-    excelMetadataIn = pd.read_excel(
-        excelSheet,
-        sheet_name=rulesSheetName,
-        header=startRow_Params - 1,
-        nrows=numRows,
-        usecols=colString,
-    )
+    with pd.ExcelFile(excel_file, engine="openpyxl") as excel_sheets:
+        excelMetadataIn = pd.read_excel(
+            excel_sheets,
+            sheet_name=rulesSheetName,
+            header=startRow_Params - 1,
+            nrows=numRows,
+            usecols=colString,
+        )
 
     ## Drop empty rows (where 'Sheet' is NaN)
     excelMetadataIn = excelMetadataIn.dropna(subset="Sheet")
@@ -883,42 +930,32 @@ def convertSampleSheetExcelMediaWiki(
 
     ## Make one table per value in the 'Sheet' column
     for excelMetadataFrame in dataframeList:
-        excelMetadataFrame.reset_index(drop=True, inplace=True)
-        outStr += "\n" + r'{| class="wikitable sortable"' + "\n" + "|-\n"
+        outParts.append("\n" + r'{| class="wikitable sortable"' + "\n" + "|-\n")
 
         # Add header row elements
-        outStr += "! "
-        for colHeader in excelMetadataFrame.columns:
-            filteredColHeader = str(colHeader).replace("\r", " ").replace("\n", " ")
-            outStr += f"{filteredColHeader} !! "
-
-        # trim extra "!! "
-        outStr = outStr[:-4]
+        outParts.append("! ")
+        outParts.append(
+            " !! ".join(str(colHeader).translate(_WIKI_TRANSLATION) for colHeader in excelMetadataFrame.columns)
+        )
 
         ###display(excelMetadataFrame)
 
         # Add Metadata Row Elements
 
         ## Loop through metadata rows
-        for mdRow in excelMetadataFrame.index:
+        for mdRow in excelMetadataFrame.itertuples(index=False, name=None):
             ###Loop through columns
-            outStr += "\n|-\n| "
-            ###print(mdRow)
-            for mdVal in excelMetadataFrame.iloc[mdRow].to_list():
-                filteredmdVal = str(mdVal).replace("\r", " ").replace("\n", " ")
-                outStr += f"{filteredmdVal} || "
-                ###print(f"\t{mdVal}")
-            # trim extra " || " at the end of each line
-            outStr = outStr[:-4]
+            outParts.append("\n|-\n| ")
+            outParts.append(" || ".join(str(mdVal).translate(_WIKI_TRANSLATION) for mdVal in mdRow))
 
         # Add MediaWiki Table End
-        outStr += "\n|}\n"
-        # print(outStr)
+        outParts.append("\n|}\n")
+        # print("".join(outParts))
 
     if verbose:
         print("-" * 5 + " End Log. Copy text below this line into the wiki" + "-" * 5)
 
-    return outStr
+    return "".join(outParts)
 
 
 def isParamValid(
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from rsoxs_scans import defaults
+from rsoxs_scans.constructor import (
+    BETWEEN,
+    LESS_THAN,
+    CompiledSpec,
+    _interval_energies,
+    clear_caches,
+    compile_exposure_spec,
+    construct_exposure_times,
+    get_energies,
+    get_energies_writable,
+    get_nexafs_scan_params,
+)
+from rsoxs_scans.nexafs import nexafs_scan_enqueue
+
+
+def _linspace_energies(edge, numpnts, at_end):
+    "The per-interval np.linspace construction that _interval_energies replaces."
+    last = len(numpnts) - 1
+    return np.concatenate(
+        [
+            np.linspace(edge[i], edge[i + 1], numpnts[i] + (at_end and i == last), endpoint=at_end and i == last)
+            for i in range(len(numpnts))
+        ]
+    )
+
+
+def test_interval_energies_match_linspace():
+    "Check that the vectorized intervals are identical to the per-interval linspace, empty intervals included."
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        intervals = rng.integers(1, 6)
+        edge = np.sort(rng.uniform(70, 2000, intervals + 1))
+        numpnts = rng.integers(0, 30, intervals)
+        at_end = bool(rng.integers(2))
+        expected = _linspace_energies(edge, numpnts, at_end)
+        np.testing.assert_array_equal(_interval_energies(edge, numpnts, at_end), expected)
+
+
+def test_get_energies_last_frame_count_zero():
+    "Check that a last interval with 0 frames gives just its start, like linspace(start, end, 1)."
+    np.testing.assert_array_equal(get_energies([250, 270, 300], [5, 0]), [250, 254, 258, 262, 266, 270])
+    np.testing.assert_array_equal(get_energies([250, 270, 300], [0, 3]), [270, 280, 290, 300])
+
+
+def test_edges_added_at_runtime_are_found(monkeypatch):
+    "Check that edges and aliases added to the defaults tables after import are resolved by name."
+    monkeypatch.setitem(defaults.rsoxs_edges, "myedge", (250, 260, 270))
+    monkeypatch.setitem(defaults.nexafs_edges, "myedge", (250, 260, 270))
+    monkeypatch.setitem(defaults.edge_names, "my_alias", "myedge")
+    assert len(get_energies("myedge")) == 113
+    np.testing.assert_array_equal(get_energies("My_Alias"), get_energies("myedge"))
+    scan_params, _ = get_nexafs_scan_params("MY_ALIAS")
+    assert scan_params[0][0] == 250 and scan_params[-1][1] == 270
+
+
+def test_frames_list_with_ratios_is_rejected():
+    "Check that a list of frames and explicit ratios can't be combined."
+    with pytest.raises(ValueError, match="cannot both be specified"):
+        get_energies([250, 260, 270], [2, 3], [1, 2])
+
+
+def test_fractional_frames_are_rejected():
+    "Check that frame counts in a list must be whole numbers rather than being truncated."
+    with pytest.raises(ValueError, match="whole numbers"):
+        get_energies([250, 260, 270], [2.5, 3])
+    np.testing.assert_array_equal(get_energies([250, 260, 270], [2.0, 1]), [250, 255, 260, 270])
+
+
+def test_get_energies_is_read_only_and_writable_copy_is_not():
+    "Check that the shared cached energies can't be modified, but get_energies_writable's copy can."
+    energies = get_energies("carbon")
+    with pytest.raises(ValueError):
+        energies[0] = 0
+    writable = get_energies_writable("carbon")
+    writable[0] = 0
+    assert get_energies("carbon")[0] == energies[0]
+
+
+def test_unhashable_inputs_raise_their_validation_errors():
+    "Check that invalid inputs lru_cache can't hash still get the functions' own error messages."
+    with pytest.raises(TypeError, match="invalid edge"):
+        get_energies({"edge": 1})
+    with pytest.raises(TypeError, match="all must be numbers"):
+        get_energies([250, 260, 270], [[1], 2])
+    with pytest.raises(TypeError, match="invalid edge"):
+        get_nexafs_scan_params({"edge": 1})
+    with pytest.raises(TypeError, match="NEXAFS scan speed"):
+        get_nexafs_scan_params([250, 260], {"speed": 1})
+
+
+def test_clear_caches_picks_up_edited_tables(monkeypatch):
+    "Check that results cached before a defaults table was edited are recomputed after clear_caches."
+    monkeypatch.setitem(defaults.rsoxs_edges, "cache_test", (250, 260, 270))
+    assert get_energies("cache_test")[-1] == 270
+    monkeypatch.setitem(defaults.rsoxs_edges, "cache_test", (250, 300, 350))
+    try:
+        clear_caches()
+        assert get_energies("cache_test")[-1] == 350
+    finally:
+        clear_caches()
+
+
+def test_nested_edges_and_ratios_are_rejected():
+    "Check that nested thresholds and ratios raise instead of broadcasting into bogus intervals."
+    with pytest.raises(TypeError, match="invalid edge"):
+        get_energies([[250], [260], [270]])
+    with pytest.raises(TypeError, match="invalid ratios"):
+        get_energies([250, 260, 270], 100, [[1], [2]])
+
+
+def test_nested_edges_with_frames_are_rejected():
+    "Check that nested thresholds given with a list of frames raise as well."
+    with pytest.raises(TypeError, match="invalid edge"):
+        get_energies([[250], [260], [270]], [2, 3])
+
+
+def test_nested_nexafs_edges_and_ratios_are_rejected():
+    "Check that nested NEXAFS thresholds and ratios raise instead of broadcasting into bogus regions."
+    with pytest.raises(TypeError, match="invalid edge"):
+        get_nexafs_scan_params([[250], [260]])
+    with pytest.raises(TypeError, match="invalid ratios"):
+        get_nexafs_scan_params([250, 260], 1, [[1]])
+
+
+def test_nexafs_estimate_only_matches_full_estimate():
+    "Check that estimate_only skips the scan parameters but estimates the same time."
+    scan_params, time = get_nexafs_scan_params("carbon", "normal")
+    assert len(scan_params) > 0
+    assert get_nexafs_scan_params("carbon", "normal", estimate_only=True) == (None, time)
+
+
+def test_compile_exposure_spec():
+    "Check that an exposure time list is parsed into its default and (op, low, high, time) tests."
+    spec = compile_exposure_spec([1, ("less_than", 270), 10, ("between", 285, 288), 0.1])
+    assert spec == CompiledSpec(1.0, ((LESS_THAN, 270, None, 10), (BETWEEN, 285, 288, 0.1)))
+    with pytest.raises(ValueError, match="Invalid test"):
+        compile_exposure_spec([1, ("more_than", 270), 10])
+
+
+def test_compiled_exposure_times_match_the_list():
+    "Check that a CompiledSpec gives the same exposure times and estimate as the list it was compiled from."
+    energies = np.asarray(get_energies("carbon"))
+    exposure_time = [1, ("less_than", 270), 10, ("greater than", 300), 2, ("between", 285, 288), 0.1]
+    times, time = construct_exposure_times(energies, exposure_time, repeats=2)
+    expected = np.where(energies < 270, 10.0, np.where(energies > 300, 2.0, 1.0))
+    expected[(285 < energies) & (energies < 288)] = 0.1
+    np.testing.assert_array_equal(times, expected)
+    assert time == pytest.approx(float((expected * 2 + 1).sum()) + 4 * len(energies))
+    spec_times, spec_time = construct_exposure_times(energies, compile_exposure_spec(exposure_time), repeats=2)
+    np.testing.assert_array_equal(spec_times, times)
+    assert spec_time == time
+
+
+@pytest.mark.parametrize(
+    "scan_params",
+    [[(250, 260), (270, 280), (290, 300)], [(250, 260, 1), (270, 280)], [], [("a", 1, 2)]],
+)
+def test_nexafs_enqueue_rejects_malformed_scan_params(scan_params):
+    "Check that scan_params which aren't (start, end, speed) segments are reported, not regrouped."
+    result = nexafs_scan_enqueue(scan_params, grating="rsoxs")
+    assert result["action"] == "error"
+    assert "could not be parsed" in result["description"]
@@ -0,0 +1,115 @@
+import warnings
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from rsoxs_scans.spreadsheets import (
+    _excel_value,
+    _fast_records,
+    _parse_cell_literal,
+    _probe_header,
+    load_samplesxlsx,
+    save_samplesxlsx,
+)
+
+
+EXAMPLES = Path(__file__).parents[2] / "example"
+
+
+def _without_uids(bar):
+    "The bar with the acquisition uids, which are made anew on every load, left out."
+    return [
+        {
+            **sample,
+            "acquisitions": [{k: v for k, v in acq.items() if k != "uid"} for acq in sample["acquisitions"]],
+        }
+        for sample in bar
+    ]
+
+
+def _fixed_proposal_info(proposal_id, *args, **kwargs):
+    "Stands in for the PASS lookup, so the tests don't go to the network."
+    return "pass-311234", "/sst/2023-2/pass-311234/", 310000, {"proposal_id": "311234", "title": "test"}
+
+
+def test_save_and_reload_round_trip(tmp_path, monkeypatch):
+    "Check that a saved bar loads back the same, without warning about the exported sheet headers."
+    monkeypatch.setattr("rsoxs_scans.spreadsheets.get_proposal_info", _fixed_proposal_info)
+    bar = load_samplesxlsx(EXAMPLES / "Sample_Bar_v2023_2.xlsx")
+    save_samplesxlsx(bar, name="roundtrip", path=f"{tmp_path}/")
+    (exported,) = tmp_path.glob("out_*_roundtrip.xlsx")
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        reloaded = load_samplesxlsx(exported)
+    assert not [warning for warning in caught if "sheet headers" in str(warning.message)]
+    assert _without_uids(reloaded) == _without_uids(bar)
+
+
+def test_probe_header():
+    "Check that the instruction rows are found in a template, and that exported sheets have none."
+    template = load_workbook(EXAMPLES / "Sample_Bar_v2023_2.xlsx", read_only=True)
+    assert _probe_header(template["Bar"]) == ([1, 2, 3, 4], [])
+    assert _probe_header(template["Acquisitions"]) == ([1, 2, 3, 4], [])
+    exported = load_workbook(EXAMPLES / "out_2023-03-12_10-23-55_test2.xlsx", read_only=True)
+    assert _probe_header(exported["Bar"]) == ([], [])
+    with pytest.raises(ValueError, match="Descriptions"):
+        _probe_header(exported["Acquisitions"])
+
+
+def test_excel_value_matches_pandas_writer(tmp_path):
+    "Check that cells written through _excel_value read back the same as cells written by pandas' to_excel."
+    df = pd.DataFrame(
+        {
+            "missing": [np.nan, None],
+            "numbers": pd.Series([np.int64(3), np.float64(2.5)], dtype=object),
+            "infinite": [np.inf, -np.inf],
+            "flags": [True, np.bool_(False)],
+            "objects": [[1, 2], {"a": 1}],
+            "text": ["=not a formula", "plain"],
+            "dates": [datetime(2023, 3, 12, 10, 23), pd.NaT],
+            "durations": [timedelta(hours=6), timedelta(seconds=30)],
+        }
+    )
+    df.to_excel(tmp_path / "pandas.xlsx", index=False)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        sheet.append([_excel_value(value) for value in row])
+    workbook.save(tmp_path / "openpyxl.xlsx")
+    expected = list(load_workbook(tmp_path / "pandas.xlsx").active.values)
+    written = list(load_workbook(tmp_path / "openpyxl.xlsx").active.values)
+    assert [[(type(v), v) for v in row] for row in written] == [[(type(v), v) for v in row] for row in expected]
+
+
+def test_fast_records_match_to_dict():
+    "Check that _fast_records gives the values and types of to_dict, numpy scalars in object columns included."
+    df = pd.DataFrame(
+        {
+            "boxed": pd.Series([np.float64(1.5), np.int64(2)], dtype=object),
+            "mixed": pd.Series([np.bool_(True), "text"], dtype=object),
+            "floats": [1.0, 2.0],
+            "ints": [1, 2],
+            "lists": [[1, 2], ""],
+        }
+    )
+    records = _fast_records(df)
+    expected = df.to_dict(orient="records")
+    assert [[(k, type(v), v) for k, v in r.items()] for r in records] == [
+        [(k, type(v), v) for k, v in r.items()] for r in expected
+    ]
+
+
+def test_parse_cell_literal():
+    "Check that generated Bar cells are read as json or python literals, and unreadable cells raise ValueError."
+    assert _parse_cell_literal("", [], "location", "s1") == []
+    assert _parse_cell_literal('[{"motor": "x", "position": 3}]', [], "location", "s1") == [
+        {"motor": "x", "position": 3}
+    ]
+    assert _parse_cell_literal("{'front': True, 'th': None}", {}, "bar_loc", "s1") == {"front": True, "th": None}
+    with pytest.raises(ValueError, match="location of sample_id:s1"):
+        _parse_cell_literal("[{'motor': 'x', 'position': 3", [], "location", "s1")